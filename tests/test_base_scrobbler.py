@@ -1,120 +1,146 @@
 from collections import deque
-import random
+from itertools import islice
+from operator import attrgetter
 import unittest
-from unittest.mock import patch, Mock, PropertyMock
+from unittest.mock import call, patch, Mock
 
 from legacy_scrobbler.clients import base
 
 from .data.listens import listens
 
+# listens are in descending chronological order, so the first scrobble
+# request for all of them should contain the 50 oldest, oldest first
+_FIRST_SCROBBLE_BATCH = deque(islice(reversed(listens), 50))
+
+
+class _ConstProp:
+    """
+    Descriptor that stands in for a property with a constant value. Meant
+    to be installed with patch.object(cls, name, new=_ConstProp(value)),
+    so the original property is restored when the patch ends.
+    """
+
+    def __init__(self, value):
+        self.value = value
+
+    def __get__(self, instance, owner):
+        return self.value
+
 
 class BaseClientTests(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        # listens are in descending chronological order. They are shared by
+        # all tests and only ever read, never mutated.
+        cls.listens = listens
+
     @patch.multiple(base.ScrobbleClientBase, __abstractmethods__=set())
     def setUp(self):
         self.client = base.ScrobbleClientBase()
-        self.listens = listens
 
-    @patch.object(base.Delay, "is_active", new_callable=PropertyMock)
-    @patch.object(base.ScrobbleClientBase, "_execute_request")
-    def test_tick(self, mocked_execute_request: Mock, mocked_is_active: Mock):
+        # _execute_request is abstract and would make actual requests in a
+        # concrete client. It is mocked for every test so tests can check
+        # whether and how it was called.
+        patcher = patch.object(base.ScrobbleClientBase, "_execute_request")
+        self.mocked_execute_request = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    # The tests for ScrobbleClientBase.tick() below each cover one situation.
+    # ScrobbleClientBase._execute_request() is mocked in setUp() and is used
+    # to determine if tick() has called the method and which arguments were
+    # given to it. Where the client is in state "no_session", the property
+    # legacy_scrobbler.delay.Delay.is_active is patched with patch.object
+    # to a _ConstProp to simulate a specific program state.
+
+    def test_tick_no_session_during_delay(self):
         """
         Tests legacy_scrobbler.client.base.ScrobbleClientBase.tick()
 
-        The property legacy_scrobbler.delay.Delay.is_active is mocked during
-        this test to simulate a specific program state.
-
-        The method ScrobbleClientBase._execute_request() is mocked during this
-        test to determine if tick() has called the method and which arguments
-        were given to it.
-
-        Situations tested:
-        - if self.state is "no_session" but delay.is_active returns
-          True, nothing should happen (that is, _execute_request should not
-          be called)
-        - if self.state is "idle" and neither self.np is set nor self.queue
-          contains any listens, nothing should happen (that is,
-          _execute_request should not be called)
-        - if self.state is "no_session" and delay.is_active returns False,
-          execute_request should be called with the arguments:
-            method=self.handshake
-            else_cb=self.on_handshake_success
-            finally_cb=self.on_handshake
-        - if self.state is "idle" and self.np is set, _execute_request should
-          be called with the arguments:
-            method=self.nowplaying
-            else_cb=self.on_nowplaying_success
-            arg=self.np
-        - if self.state is "idle" and self.queue contains listens,
-          _execute_request should be called with the arguments:
-            method=self.scrobble
-            else_cb=self.on_scrobble_success
-            arg=deque(list(self.queue)[:50])
-
-
-        :param mocked_execute_request: Mock method of _execute_request
-        :param mocked_is_active: Mock method of delay.is_active
+        If self.state is "no_session" but delay.is_active returns True,
+        nothing should happen (that is, _execute_request should not be
+        called).
         """
-
-        # if self.state is "no_session" but delay.is_active returns
-        # True, nothing should happen (that is, _execute_request should not
-        # be called)
         self.client.state = "no_session"
-        mocked_is_active.return_value = True
-        self.client.tick()
-        mocked_execute_request.assert_not_called()
+        with patch.object(base.Delay, "is_active", new=_ConstProp(True)):
+            self.client.tick()
+        self.mocked_execute_request.assert_not_called()
+
+    def test_tick_idle_without_work(self):
+        """
+        Tests legacy_scrobbler.client.base.ScrobbleClientBase.tick()
 
-        # if self.state is "idle" and neither self.np is set nor self.queue
-        # contains any listens, nothing should happen (that is,
-        # _execute_request should not be called)
+        If self.state is "idle" and neither self.np is set nor self.queue
+        contains any listens, nothing should happen (that is,
+        _execute_request should not be called).
+        """
         self.client.state = "idle"
-        self.client.np = None
-        self.client.queue.clear()
         self.client.tick()
-        mocked_execute_request.assert_not_called()
+        self.mocked_execute_request.assert_not_called()
+
+    def test_tick_no_session_handshakes(self):
+        """
+        Tests legacy_scrobbler.client.base.ScrobbleClientBase.tick()
 
-        # if self.state is "no_session" and delay.is_active returns False,
-        # execute_request should be called with the arguments:
-        #   method=self.handshake
-        #   else_cb=self.on_handshake_success
-        #   finally_cb=self.on_handshake
+        If self.state is "no_session" and delay.is_active returns False,
+        _execute_request should be called with the arguments:
+            method=self.handshake
+            else_cb=self.on_handshake_success
+            finally_cb=self.on_handshake
+        """
         self.client.state = "no_session"
-        mocked_is_active.return_value = False
-        self.client.tick()
-        mocked_execute_request.assert_called_with(
-            method=self.client.handshake,
-            else_cb=self.client.on_handshake_success,
-            finally_cb=self.client.on_handshake,
+        with patch.object(base.Delay, "is_active", new=_ConstProp(False)):
+            self.client.tick()
+        self.assertEqual(
+            self.mocked_execute_request.call_args,
+            call(
+                method=self.client.handshake,
+                else_cb=self.client.on_handshake_success,
+                finally_cb=self.client.on_handshake,
+            ),
         )
-        mocked_execute_request.reset_mock()
 
-        # if self.state is "idle" and self.np is set, _execute_request should
-        # be called with the arguments:
-        #   method=self.nowplaying
-        #   else_cb=self.on_nowplaying_success
-        #   arg=self.np
+    def test_tick_idle_sends_nowplaying(self):
+        """
+        Tests legacy_scrobbler.client.base.ScrobbleClientBase.tick()
+
+        If self.state is "idle" and self.np is set, _execute_request should
+        be called with the arguments:
+            method=self.nowplaying
+            else_cb=self.on_nowplaying_success
+            arg=self.np
+        """
         self.client.state = "idle"
         self.client.np = self.listens[0]
         self.client.tick()
-        mocked_execute_request.assert_called_with(
-            method=self.client.nowplaying,
-            else_cb=self.client.on_nowplaying_success,
-            arg=self.client.np,
+        self.assertEqual(
+            self.mocked_execute_request.call_args,
+            call(
+                method=self.client.nowplaying,
+                else_cb=self.client.on_nowplaying_success,
+                arg=self.client.np,
+            ),
         )
-        # unset self.client.np
-        self.client.np = None
 
-        # if self.state is "idle" and self.queue contains listens,
-        # _execute_request should be called with the arguments:
-        #   method=self.scrobble
-        #   else_cb=self.on_scrobble_success
-        #   arg=deque(list(self.queue)[:50])
+    def test_tick_idle_scrobbles(self):
+        """
+        Tests legacy_scrobbler.client.base.ScrobbleClientBase.tick()
+
+        If self.state is "idle" and self.queue contains listens,
+        _execute_request should be called with the arguments:
+            method=self.scrobble
+            else_cb=self.on_scrobble_success
+            arg=deque(islice(self.queue, 50))
+        """
         self.client.state = "idle"
         self.client.add_listens(self.listens)
         self.client.tick()
-        mocked_execute_request.assert_called_with(
-            method=self.client.scrobble,
-            else_cb=self.client.on_scrobble_success,
-            arg=deque(list(self.client.queue)[:50]),
+        self.assertEqual(
+            self.mocked_execute_request.call_args,
+            call(
+                method=self.client.scrobble,
+                else_cb=self.client.on_scrobble_success,
+                arg=_FIRST_SCROBBLE_BATCH,
+            ),
         )
 
     def test_send_nowplaying(self):
@@ -144,40 +170,39 @@ class BaseClientTests(unittest.TestCase):
         others = [self.listens[19], self.listens[3], self.listens[13], self.listens[1]]
         self.client.add_listens(others)
 
-        # queue should be [19, 13, 10, 3, 1, 0]
-        expected = deque(
-            [
-                self.listens[19],
-                self.listens[13],
-                self.listens[10],
-                self.listens[3],
-                self.listens[1],
-                self.listens[0],
-            ]
-        )
-
-        self.assertEqual(self.client.queue, expected)
+        # queue should contain all six listens in chronological order,
+        # i.e. [19, 13, 10, 3, 1, 0]
+        self.assert_queue_chronological(queue + others)
 
     def test_sort_queue(self):
         """
         Tests legacy_scrobbler.client.base.ScrobbleClientBase._sort_queue()
 
-        Initializes self.client.queue with the shuffled self.listens.
-        The queue after sorting should be in chronological order.
-        self.listens are sorted in descending chronological order (most recent
-        first), so after sorting, the queue should be the reverse of
-        self.listens
+        Initializes self.client.queue with self.listens, which are sorted in
+        descending chronological order (most recent first). This is the
+        worst case for sorting since no listen is in its final position.
+        The queue after sorting should be in chronological order, i.e. the
+        reverse of self.listens
         """
-        # set the shuffled self.listens as queue
-        queue = self.listens[:]
-        random.shuffle(queue)
-        self.client.queue = deque(queue)
+        # set the reverse chronologically sorted self.listens as queue
+        self.client.queue = deque(self.listens)
 
-        # self.listens is reverse chronologically sorted, queue after sort
-        # should be reverse of self.listens
+        # queue after sort should contain all of self.listens in
+        # chronological order, i.e. the reverse of self.listens
         self.client._sort_queue()
-        expected = deque(self.listens[::-1])
-        self.assertEqual(self.client.queue, expected)
+        self.assert_queue_chronological(self.listens)
+
+    def assert_queue_chronological(self, listens):
+        """
+        Asserts that self.client.queue contains exactly the given listens and
+        that they are in chronological order. Shared by the tests for the
+        methods that are responsible for keeping the queue sorted.
+
+        :param listens: Iterable of the Listen objects expected in the queue
+        """
+        queue = list(self.client.queue)
+        self.assertEqual(queue, sorted(queue, key=attrgetter("date")))
+        self.assertCountEqual(queue, listens)
 
     def test_in_case_of_failure(self):
         """
@@ -198,7 +223,7 @@ class BaseClientTests(unittest.TestCase):
 
         # should call _increase_delay()
         # mocking _increase_delay to assure that it was called
-        with patch.object(base.Delay, "increase") as mock_method:
+        with patch.object(base.Delay, "increase", new=Mock()) as mock_method:
             self.client._in_case_of_failure()
             mock_method.assert_called()
 
@@ -215,14 +240,14 @@ class BaseClientTests(unittest.TestCase):
 
     def test_callbacks(self):
         # on_handshake
-        with patch.object(self.client.delay, "update") as mock_method:
+        with patch.object(self.client.delay, "update", new=Mock()) as mock_method:
             self.client.on_handshake()
             mock_method.assert_called()
 
         # on_handshake_success
         self.client.hard_fails = 23
         self.client.state = "no_session"
-        with patch.object(self.client.delay, "reset") as mock_method:
+        with patch.object(self.client.delay, "reset", new=Mock()) as mock_method:
             self.client.on_handshake_success()
             mock_method.assert_called()
         self.assertEqual(self.client.hard_fails, 0)
@@ -239,5 +264,4 @@ class BaseClientTests(unittest.TestCase):
         self.client.on_scrobble_success()
         len_after = len(self.client.queue)
         self.assertEqual(len_before - len_after, 50)
-        expected_remaining_queue = deque(self.listens[50:])
-        self.assertEqual(self.client.queue, expected_remaining_queue)
+        self.assertEqual(tuple(self.client.queue), self.listens[50:])
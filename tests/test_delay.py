@@ -1,9 +1,28 @@
-import datetime
+from datetime import datetime, timedelta, timezone
 import unittest
-from unittest.mock import patch, PropertyMock
+from unittest.mock import patch
 
 from legacy_scrobbler.delay import Delay
 
+# fixed date, used as frozen now and wherever any past date will do
+_NOW = datetime(2019, 5, 1, 12, 0, tzinfo=timezone.utc)
+
+
+class _DelayZero(Delay):
+    """Delay whose remaining time is always zero"""
+
+    @property
+    def remaining(self) -> timedelta:
+        return timedelta(seconds=0)
+
+
+class _DelayActive(Delay):
+    """Delay whose remaining time is always greater than zero"""
+
+    @property
+    def remaining(self) -> timedelta:
+        return timedelta(seconds=100)
+
 
 class DelayTests(unittest.TestCase):
     """Tests for legacy_scrobbler.delay.Delay"""
@@ -24,10 +43,11 @@ class DelayTests(unittest.TestCase):
 
         # start() should set _start_time to now, though we have to test for an
         # interval since a bit of time passes between the call and now
-        now = datetime.datetime.now(datetime.timezone.utc)
-        lower = now - datetime.timedelta(seconds=0.1)
-        upper = now + datetime.timedelta(seconds=0.1)
-        self.assertTrue(lower <= self.delay._start_time <= upper)
+        now = datetime.now(timezone.utc)
+        lower = now - timedelta(seconds=0.1)
+        upper = now + timedelta(seconds=0.1)
+        self.assertGreaterEqual(self.delay._start_time, lower)
+        self.assertLessEqual(self.delay._start_time, upper)
 
         # start() calls increase(), therefore _seconds should be base delay
         base_delay = self.delay._options["base"]
@@ -36,7 +56,7 @@ class DelayTests(unittest.TestCase):
     def test_reset(self):
         """Tests legacy_scrobbler.delay.Delay.reset()"""
         # set a start time and a delay
-        self.delay._start_time = datetime.datetime.now(datetime.timezone.utc)
+        self.delay._start_time = _NOW
         self.delay._seconds = 200
 
         # call reset. seconds and start time should be 0 and None, respectively
@@ -53,28 +73,16 @@ class DelayTests(unittest.TestCase):
         - If Delay.remaining returns a timedelta greater than zero,
           Delay.is_active should return True.
 
-        The test mocks Delay.remaining in order to create the two
-        circumstances that should be tested.
+        The test uses subclasses of Delay with an overridden Delay.remaining
+        in order to create the two circumstances that should be tested.
         """
-        # patch Delay.remaining method to always return a delta of
-        # zero. Delay.is_active should return False in this case.
-        with patch.object(
-            Delay,
-            "remaining",
-            new_callable=PropertyMock,
-            return_value=datetime.timedelta(seconds=0),
-        ):
-            self.assertFalse(self.delay.is_active)
-
-        # patch _time_to_next_handshake method to always return a delta greater
-        # than zero. _allowed_to_handshake should return False in this case.
-        with patch.object(
-            Delay,
-            "remaining",
-            new_callable=PropertyMock,
-            return_value=datetime.timedelta(seconds=100),
-        ):
-            self.assertTrue(self.delay.is_active)
+        # Delay.remaining always returns a delta of zero. Delay.is_active
+        # should return False in this case.
+        self.assertFalse(_DelayZero().is_active)
+
+        # Delay.remaining always returns a delta greater than zero.
+        # Delay.is_active should return True in this case.
+        self.assertTrue(_DelayActive().is_active)
 
     def test_remaining(self):
         """
@@ -92,28 +100,27 @@ class DelayTests(unittest.TestCase):
         """
         # timedelta on no delay should be zero
         self.delay._seconds = 0
-        self.assertEqual(self.delay.remaining, datetime.timedelta(seconds=0))
+        self.assertEqual(self.delay.remaining, timedelta(seconds=0))
 
         # timedelta on no start time should be zero
         self.delay._seconds = 8 * 60
         self.delay._start_time = None
-        self.assertEqual(self.delay.remaining, datetime.timedelta(seconds=0))
+        self.assertEqual(self.delay.remaining, timedelta(seconds=0))
 
-        # test with a delay of eight minutes and start time ten minutes
-        # ago. Delay has passed so result should be a zero timedelta
-        now = datetime.datetime.now(datetime.timezone.utc)
-        self.delay._start_time = now - datetime.timedelta(minutes=10)
-        self.assertEqual(self.delay.remaining, datetime.timedelta(seconds=0))
+        # test with a delay of eight minutes and a start time in the past
+        # that is more than eight minutes ago. Delay has passed so result
+        # should be a zero timedelta
+        self.delay._start_time = _NOW - timedelta(minutes=10)
+        self.assertEqual(self.delay.remaining, timedelta(seconds=0))
 
         # test with a delay of eight minutes and start time 4 mins 40 secs
-        # ago. Expected value is a timedelta of 3 mins 20 secs. However, the
-        # function call takes som microseconds so the actual value will be
-        # slightly smaller. Actual value should be between 3:19.9 and 3:20
-        self.delay._start_time = now - datetime.timedelta(minutes=4, seconds=40)
-        remaining = self.delay.remaining
-        lower_bound = datetime.timedelta(minutes=3, seconds=19.9)
-        upper_bound = datetime.timedelta(minutes=3, seconds=20)
-        self.assertTrue(lower_bound <= remaining <= upper_bound)
+        # ago. Expected value is a timedelta of 3 mins 20 secs. The clock
+        # read by Delay.remaining is frozen at _NOW so the value is exact.
+        with patch("legacy_scrobbler.delay.datetime") as mocked_datetime:
+            mocked_datetime.datetime.now.return_value = _NOW
+            mocked_datetime.timedelta = timedelta
+            self.delay._start_time = _NOW - timedelta(minutes=4, seconds=40)
+            self.assertEqual(self.delay.remaining, timedelta(minutes=3, seconds=20))
 
     def test_increase(self):
         """
@@ -127,24 +134,15 @@ class DelayTests(unittest.TestCase):
         # set delay to 0
         self.delay._seconds = 0
 
-        # grab options
-        base_delay = self.delay._options["base"]
-        max_delay = self.delay._options["max"]
-        multiplier = self.delay._options["multiplier"]
-
-        # increase the delay as long as it is smaller than max_delay
-        num_increase = 0
-        while self.delay._seconds < max_delay:
+        # with a base of 60 seconds and a multiplier of 2, eight increases
+        # double the delay from the base until it reaches the max delay of
+        # 7200 seconds. Increasing further should have no effect.
+        delays = []
+        for _ in range(10):
             self.delay.increase()
-            expected = min(base_delay * multiplier ** num_increase, max_delay)
-            self.assertEqual(self.delay._seconds, expected)
-            num_increase += 1
-
-        # increasing further should have no effect
-        self.delay.increase()
-        self.assertEqual(self.delay._seconds, max_delay)
-        self.delay.increase()
-        self.assertEqual(self.delay._seconds, max_delay)
+            delays.append(self.delay._seconds)
+        expected = [60, 120, 240, 480, 960, 1920, 3840, 7200, 7200, 7200]
+        self.assertEqual(delays, expected)
 
         # reset delay to zero
         self.delay._seconds = 0
@@ -1,13 +1,13 @@
 import hashlib
+from typing import Iterable
 import unittest
 from unittest.mock import patch, Mock
-from urllib.parse import urlparse, parse_qs, unquote
+from urllib.parse import urlparse, parse_qsl
 
 import httmock
 import requests
 
 from legacy_scrobbler.clients.legacy import LegacyScrobbler
-from legacy_scrobbler.listen import Listens
 from legacy_scrobbler.exceptions import (
     HardFailureError,
     RequestsError,
@@ -18,10 +18,49 @@ from legacy_scrobbler.exceptions import (
 
 from .data.listens import listens
 
+# password hash of the test user as bytes, used to verify the handshake auth
+_PW_HASH_BYTES = b"3858f62230ac3c915f300c664312c63f"
+
+# query params that are required in the requests made by the client
+_REQUIRED_HANDSHAKE_PARAMS = frozenset(["hs", "p", "c", "v", "u", "t", "a"])
+_REQUIRED_NOWPLAYING_PARAMS = frozenset(["s", "a", "t", "b", "l", "n", "m"])
+
+# names of the per-listen params of a scrobble request, indexed as "a[0]"
+_SCROBBLE_PARAM_NAMES = ("a", "t", "i", "o", "r", "l", "b", "n", "m")
+
+# required params of a scrobble request with the 50 listens used in the tests
+_NUM_SCROBBLED_LISTENS = 50
+_REQUIRED_SCROBBLE_PARAMS = frozenset(
+    f"{name}[{i}]"
+    for i in range(_NUM_SCROBBLED_LISTENS)
+    for name in _SCROBBLE_PARAM_NAMES
+).union(["s"])
+
+
+class _CallCounter:
+    """Callable that counts how often it has been called"""
+
+    __slots__ = ("calls",)
+
+    def __init__(self):
+        self.calls = 0
+
+    def __call__(self, *args, **kwargs):
+        self.calls += 1
+
 
 class ScrobblerClientTests(unittest.TestCase):
     """Tests for legacy_scrobbler.client.LegacyScrobbler"""
 
+    @classmethod
+    def setUpClass(cls):
+        # values usually received during handshake and the listens used in
+        # the tests. None of these are modified by the tests.
+        cls.session = "fakesession"
+        cls.nowplaying_url = "http://somescrobblernetwork.com/nowplaying"
+        cls.submission_url = "http://somescrobblernetwork.com/submission"
+        cls.listens = listens
+
     def setUp(self):
         # create client
         self.client = LegacyScrobbler(
@@ -32,15 +71,10 @@ class ScrobblerClientTests(unittest.TestCase):
         )
 
         # set values on client usually received during handshake
-        self.session = "fakesession"
-        self.nowplaying_url = "http://somescrobblernetwork.com/nowplaying"
-        self.submission_url = "http://somescrobblernetwork.com/submission"
         self.client.session = self.session
         self.client.nowplaying_url = self.nowplaying_url
         self.client.scrobble_url = self.submission_url
 
-        self.listens = listens
-
     def test_handshake(self):
         """
         Tests legacy_scrobbler.client.legacy.LegacyScrobbler.handshake() for
@@ -56,20 +90,19 @@ class ScrobblerClientTests(unittest.TestCase):
             self.assertEqual(request.method, "GET")
 
             # extract received query params from request
-            query_params = parse_qs(urlparse(request.url).query)
+            pairs = parse_qsl(urlparse(request.url).query)
+            query_params = dict(pairs)
+
+            # If a param was present more than once in the request, the dict
+            # would have fewer entries than received pairs. This shouldn't
+            # happen.
+            self.assertEqual(len(pairs), len(query_params))
 
             # check that all required params present
-            required = ["hs", "p", "c", "v", "u", "t", "a"]
             received = query_params.keys()
-            self.assertTrue(self.required_params_present(required, received))
-
-            # extracted list of query params is a dict with the param as key
-            # and param value as a list. {"param": ["value"]}
-            # If a param was present more than once in the request, the list
-            # of values would contain multiple items. This shouldn't happen.
-            for key, val in query_params.items():
-                self.assertEqual(len(val), 1)
-                query_params[key] = val[0]
+            self.assertTrue(
+                self.required_params_present(_REQUIRED_HANDSHAKE_PARAMS, received)
+            )
 
             # query values should equal expected values
             self.assertEqual(query_params["hs"], "true")
@@ -80,9 +113,8 @@ class ScrobblerClientTests(unittest.TestCase):
             self.assertTrue(query_params["t"].isnumeric())
 
             # calculate expected auth and compare to submitted auth
-            timestamp = query_params["t"].encode("utf-8")
-            password_hash = "3858f62230ac3c915f300c664312c63f".encode("utf-8")
-            auth = hashlib.md5(password_hash + timestamp).hexdigest()
+            timestamp = query_params["t"].encode("ascii")
+            auth = hashlib.md5(_PW_HASH_BYTES + timestamp).hexdigest()
             self.assertEqual(query_params["a"], auth)
 
             # bogus (but successful) handshake response content
@@ -106,24 +138,23 @@ class ScrobblerClientTests(unittest.TestCase):
             # nowplaying method should be POST
             self.assertEqual(request.method, "POST")
 
-            # make sure that the request body is utf-8 encoded
-            unquote(request.body, encoding="utf-8", errors="strict")
+            # extract received query params from request body. Decoding
+            # strictly makes sure that the request body is utf-8 encoded
+            pairs = parse_qsl(
+                request.body, keep_blank_values=True, encoding="utf-8", errors="strict"
+            )
+            query_params = dict(pairs)
 
-            # extract received query params from request body
-            query_params = parse_qs(request.body, keep_blank_values=True)
+            # If a param was present more than once in the request, the dict
+            # would have fewer entries than received pairs. This shouldn't
+            # happen.
+            self.assertEqual(len(pairs), len(query_params))
 
             # check that all required params present
-            required = ["s", "a", "t", "b", "l", "n", "m"]
             received = query_params.keys()
-            self.assertTrue(self.required_params_present(required, received))
-
-            # extracted list of query params is a dict with the param as key
-            # and param value as a list. {"param": ["value"]}
-            # If a param was present more than once in the request, the list
-            # of values would contain multiple items. This shouldn't happen.
-            for key, val in query_params.items():
-                self.assertEqual(len(val), 1)
-                query_params[key] = val[0]
+            self.assertTrue(
+                self.required_params_present(_REQUIRED_NOWPLAYING_PARAMS, received)
+            )
 
             # query values should equal expected values
             listen = self.listens[0]
@@ -155,25 +186,23 @@ class ScrobblerClientTests(unittest.TestCase):
             # scrobble method should be POST
             self.assertEqual(request.method, "POST")
 
-            # make sure that the request body is utf-8 encoded
-            unquote(request.body, encoding="utf-8", errors="strict")
+            # extract received query params from request body. Decoding
+            # strictly makes sure that the request body is utf-8 encoded
+            pairs = parse_qsl(
+                request.body, keep_blank_values=True, encoding="utf-8", errors="strict"
+            )
+            query_params = dict(pairs)
 
-            # extract received query params from request body
-            query_params = parse_qs(request.body, keep_blank_values=True)
+            # If a param was present more than once in the request, the dict
+            # would have fewer entries than received pairs. This shouldn't
+            # happen.
+            self.assertEqual(len(pairs), len(query_params))
 
-            # get list of required params and check that all are present
-            required = self.build_list_of_required_params(listens_to_scrobble)
-            required += "s"
+            # check that all required params present
             received = query_params.keys()
-            self.assertTrue(self.required_params_present(required, received))
-
-            # extracted list of query params is a dict with the param as key
-            # and param value as a list. {"param": ["value"]}
-            # If a param was present more than once in the request, the list
-            # of values would contain multiple items. This shouldn't happen.
-            for key, val in query_params.items():
-                self.assertEqual(len(val), 1)
-                query_params[key] = val[0]
+            self.assertTrue(
+                self.required_params_present(_REQUIRED_SCROBBLE_PARAMS, received)
+            )
 
             # query values should equal expected values
             self.assertEqual(query_params["s"], self.session)
@@ -195,13 +224,11 @@ class ScrobblerClientTests(unittest.TestCase):
             # send response
             return httmock.response(content="OK\n", status_code=200, request=request)
 
-        listens_to_scrobble = self.listens[:50]
+        listens_to_scrobble = self.listens[:_NUM_SCROBBLED_LISTENS]
         with httmock.HTTMock(validate_scrobble):
             self.client.scrobble(listens_to_scrobble)
 
-    @patch.object(LegacyScrobbler, "_in_case_of_failure")
-    @patch.object(LegacyScrobbler, "handshake")
-    def test_execute(self, mocked_handshake, mocked_in_case_of_failure):
+    def test_execute(self):
         """
         Tests legacy_scrobbler.client.legacy.LegacyScrobbler._execute_request()
 
@@ -232,115 +259,98 @@ class ScrobblerClientTests(unittest.TestCase):
         - on an unsuccessful request, the else_cb should not be called
         - the finally_cb should be called on both a successful and an
           unsuccessful request
-
-        :param mocked_handshake: Mock method of handshake
-        :param mocked_in_case_of_failure: Mock method of _in_case_of_failure()
         """
+        # patch handshake and _in_case_of_failure with prebuilt mocks.
         # we have to set function __name__ on the mocked handshake
+        mocked_handshake = Mock()
         mocked_handshake.__name__ = "handshake"
+        mocked_in_case_of_failure = Mock()
+        for name, mock in [
+            ("handshake", mocked_handshake),
+            ("_in_case_of_failure", mocked_in_case_of_failure),
+        ]:
+            patcher = patch.object(LegacyScrobbler, name, new=mock)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+        # bind the methods used in every situation below
+        execute_request = self.client._execute_request
+        handshake = self.client.handshake
+
+        # exceptions raised by the input callable and how _execute_request
+        # should handle them:
+        # - "failure": _in_case_of_failure should be called
+        # - "badsession": session should be unset and state set to
+        #   "no_session"
+        # - "reraise": the same error should be re-raised
+        cases = [
+            (HardFailureError(), "failure"),
+            (RequestsError(), "failure"),
+            (BadSessionError(), "badsession"),
+            (HandshakeError(), "reraise"),
+            (SubmissionWithoutListensError(), "reraise"),
+        ]
 
-        # if the input callable raises a HardFailureError, _in_case_of_failure
-        # should be called
-        mocked_handshake.side_effect = HardFailureError()
-        self.client._execute_request(method=self.client.handshake)
-        mocked_in_case_of_failure.assert_called()
-        mocked_in_case_of_failure.reset_mock()
-
-        # if the input callable raises a RequestsError, _in_case_of_failure
-        # should be called
-        mocked_handshake.side_effect = RequestsError()
-        self.client._execute_request(method=self.client.handshake)
-        mocked_in_case_of_failure.assert_called()
-        mocked_in_case_of_failure.reset_mock()
-
-        # if the input callable raises a BadSessionError, session should be
-        # unset and state set to "no_session"
-        mocked_handshake.side_effect = BadSessionError()
-        self.client._execute_request(method=self.client.handshake)
-        self.assertIsNone(self.client.session)
-        self.assertEqual(self.client.state, "no_session")
-
-        # if the input callable raises a HandshakeError, the same error should
-        # be re-raised
-        mocked_handshake.side_effect = HandshakeError()
-        self.assertRaises(
-            HandshakeError, self.client._execute_request, method=self.client.handshake
-        )
-
-        # if the input callable raises a SubmissionWithoutListensError, the
-        # same error should be re-raised
-        mocked_handshake.side_effect = SubmissionWithoutListensError()
-        self.assertRaises(
-            SubmissionWithoutListensError,
-            self.client._execute_request,
-            method=self.client.handshake,
-        )
+        for exception, handling in cases:
+            with self.subTest(exception=type(exception).__name__):
+                # start each case from an established session so unsetting
+                # it can be observed
+                self.client.state = "idle"
+                self.client.session = self.session
+                mocked_in_case_of_failure.reset_mock()
+
+                mocked_handshake.side_effect = exception
+                if handling == "reraise":
+                    with self.assertRaises(type(exception)):
+                        execute_request(method=handshake)
+                else:
+                    execute_request(method=handshake)
+
+                # _in_case_of_failure should only be called for "failure"
+                expected_calls = 1 if handling == "failure" else 0
+                self.assertEqual(mocked_in_case_of_failure.call_count, expected_calls)
+
+                # only "badsession" should unset the session and fall back
+                # to the handshake phase
+                if handling == "badsession":
+                    self.assertIsNone(self.client.session)
+                    self.assertEqual(self.client.state, "no_session")
+                else:
+                    self.assertEqual(self.client.session, self.session)
+                    self.assertEqual(self.client.state, "idle")
 
         # on a successful request, the else_cb should be called
-        else_cb = Mock()
+        else_cb = _CallCounter()
         mocked_handshake.side_effect = None
-        self.client._execute_request(method=self.client.handshake, else_cb=else_cb)
-        else_cb.assert_called()
+        execute_request(method=handshake, else_cb=else_cb)
+        self.assertEqual(else_cb.calls, 1)
 
         # on an unsuccessful request, the else_cb should not be called
-        else_cb = Mock()
+        else_cb = _CallCounter()
         mocked_handshake.side_effect = HardFailureError()
-        self.client._execute_request(method=self.client.handshake, else_cb=else_cb)
-        else_cb.assert_not_called()
+        execute_request(method=handshake, else_cb=else_cb)
+        self.assertEqual(else_cb.calls, 0)
 
         # the finally_cb should be called on both a successful and an
         # unsuccessful request
-        finally_cb = Mock()
+        finally_cb = _CallCounter()
         mocked_handshake.side_effect = None
-        self.client._execute_request(
-            method=self.client.handshake, finally_cb=finally_cb
-        )
-        finally_cb.assert_called()
-        finally_cb.reset_mock()
+        execute_request(method=handshake, finally_cb=finally_cb)
+        self.assertEqual(finally_cb.calls, 1)
 
+        finally_cb = _CallCounter()
         mocked_handshake.side_effect = HardFailureError()
-        self.client._execute_request(
-            method=self.client.handshake, finally_cb=finally_cb
-        )
-        finally_cb.assert_called()
+        execute_request(method=handshake, finally_cb=finally_cb)
+        self.assertEqual(finally_cb.calls, 1)
 
     @staticmethod
-    def required_params_present(required: list, received: list) -> bool:
+    def required_params_present(required: Iterable, received: Iterable) -> bool:
         """
-        Compares two lists against each other to find out if all elements in
-        the `required` list are in the `received` list.
+        Compares two collections against each other to find out if all
+        elements in `required` are in `received`.
 
-        :param required: list (of strings)
-        :param received: list (of strings)
+        :param required: iterable (of strings)
+        :param received: iterable (of strings)
         :return: bool
         """
-        is_present = [x in received for x in required]
-        all_present = False not in is_present
-        return all_present
-
-    @staticmethod
-    def build_list_of_required_params(l: Listens) -> list:
-        """
-        Utility function that returns a list of strings with the query params
-        that are required for a scrobble request of the listens in self.listens
-
-        :return: list of required query params as strings
-        """
-        base_params = [
-            "a[%i]",
-            "t[%i]",
-            "i[%i]",
-            "o[%i]",
-            "r[%i]",
-            "l[%i]",
-            "b[%i]",
-            "n[%i]",
-            "m[%i]",
-        ]
-
-        num_listens = len(l)
-        params = []
-        for i in range(num_listens):
-            for param in base_params:
-                params.append(param % i)
-        return params
+        return set(required).issubset(received)
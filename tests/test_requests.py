@@ -1,3 +1,4 @@
+from functools import lru_cache
 from typing import Callable
 import unittest
 
@@ -15,7 +16,29 @@ from legacy_scrobbler.exceptions import (
 )
 
 
+@lru_cache(maxsize=None)
+def _cached_callback(content: str, status_code: int) -> Callable:
+    """
+    Creates the httmock callback for RequestTests.create_callback(). Cached
+    so that every (content, status_code) combination is only built once.
+    """
+
+    @httmock.all_requests
+    def inner(url, request):
+        return httmock.response(
+            content=content, status_code=status_code, request=request
+        )
+
+    return inner
+
+
 class RequestTests:
+    # (content, status_code, exception) of responses both Request types reject
+    COMMON_ERROR_CASES = [
+        ("", 500, HardFailureError),
+        ("foobar", 200, HardFailureError),
+    ]
+
     @staticmethod
     def create_callback(content="", status_code=200) -> Callable:
         """
@@ -27,14 +50,7 @@ class RequestTests:
         :param status_code: Status code of the response object of the callback.
         :return: The callable function
         """
-
-        @httmock.all_requests
-        def inner(url, request):
-            return httmock.response(
-                content=content, status_code=status_code, request=request
-            )
-
-        return inner
+        return _cached_callback(content, status_code)
 
     def test_common_exceptions(self):
         """
@@ -55,14 +71,21 @@ class RequestTests:
             self.assertRaises(RequestsError, self.request.execute)
 
         # HardFailureError if status code is not 200
-        callback = self.create_callback(status_code=500)
-        with httmock.HTTMock(callback):
-            self.assertRaises(HardFailureError, self.request.execute)
-
         # HardFailureError if the server response is not in protocol
-        callback = self.create_callback(content="foobar")
-        with httmock.HTTMock(callback):
-            self.assertRaises(HardFailureError, self.request.execute)
+        self.assert_error_responses(self.COMMON_ERROR_CASES)
+
+    def assert_error_responses(self, cases):
+        """
+        Asserts that execute() raises the expected exception for each of the
+        given server responses. Every case runs as its own subTest.
+
+        :param cases: Iterable of (content, status_code, exception) tuples
+        """
+        for content, status_code, exception in cases:
+            with self.subTest(content=content, status_code=status_code):
+                callback = self.create_callback(content, status_code)
+                with httmock.HTTMock(callback):
+                    self.assertRaises(exception, self.request.execute)
 
 
 class HandshakeRequestTests(RequestTests, unittest.TestCase):
@@ -102,20 +125,12 @@ class HandshakeRequestTests(RequestTests, unittest.TestCase):
         - BadAuthException on server response "BADAUTH"
         - BadTimeException on server response "BADTIME"
         """
-        # ClientBannedException on server response "BANNED"
-        callback = self.create_callback(content="BANNED")
-        with httmock.HTTMock(callback):
-            self.assertRaises(ClientBannedException, self.request.execute)
-
-        # BadAuthException on server response "BADAUTH"
-        callback = self.create_callback(content="BADAUTH")
-        with httmock.HTTMock(callback):
-            self.assertRaises(BadAuthException, self.request.execute)
-
-        # BadTimeException on server response "BADTIME"
-        callback = self.create_callback(content="BADTIME")
-        with httmock.HTTMock(callback):
-            self.assertRaises(BadTimeException, self.request.execute)
+        cases = [
+            ("BANNED", 200, ClientBannedException),
+            ("BADAUTH", 200, BadAuthException),
+            ("BADTIME", 200, BadTimeException),
+        ]
+        self.assert_error_responses(cases)
 
 
 class PostRequestTests(RequestTests, unittest.TestCase):
@@ -141,7 +156,4 @@ class PostRequestTests(RequestTests, unittest.TestCase):
         - BadSessionError on server response "BADSESSION"
         """
 
-        # BadSessionError on server response "BADSESSION"
-        callback = self.create_callback(content="BADSESSION")
-        with httmock.HTTMock(callback):
-            self.assertRaises(BadSessionError, self.request.execute)
+        self.assert_error_responses([("BADSESSION", 200, BadSessionError)])